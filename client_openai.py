@@ -1,5 +1,9 @@
+import hashlib
 import re
+import threading
 import time
+from collections import deque
+from functools import lru_cache
 from openai import (
     OpenAI,
     APIConnectionError,
@@ -11,6 +15,37 @@ from openai import (
 
 from few_shot_prompts import build_system_prompt
 
+# Compiled once at import; _clean_response runs on every streamed delta
+_BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+_HEADER_RE = re.compile(r'^#{1,6}\s+', re.MULTILINE)
+_DOLLAR_ESCAPE = str.maketrans({'$': '\\$'})
+
+# Response cache tuning
+_CACHE_TTL = 6 * 3600  # seconds a cached response stays valid
+_CACHE_SIM_THRESHOLD = 0.92  # cosine similarity to treat prompts as equivalent
+_CACHE_CHUNK_SIZE = 40  # characters per yield when replaying a cached response
+_TRIVIAL_EXCHANGE_CHARS = 300  # below this, summarize locally without an API call
+_HISTORY_MAXLEN = 5  # rolling window of conversation summaries
+_TICKER_RE = re.compile(r'^[A-Z0-9]{3,4}$')  # canonical ASX ticker shape
+
+@lru_cache(maxsize=1024)
+def _embed(client, text):
+    """
+    Fetch an L2-normalized embedding for text, memoized per (client, text).
+
+    Identical queries skip the HTTP round-trip entirely. Failed calls raise
+    and are not cached, so transient errors can be retried.
+    """
+    response = client.embeddings.create(
+        model='text-embedding-3-small',
+        input=text
+    )
+    vector = response.data[0].embedding
+    norm = sum(v * v for v in vector) ** 0.5
+    if not norm:
+        return None
+    return tuple(v / norm for v in vector)
+
 class ClientOpenAI:
     """
     Class for organized usage of OpenAI API
@@ -35,9 +70,15 @@ class ClientOpenAI:
         self.annotations = []
         self.model = 'gpt-5-mini'
         self.base_system_prompt = build_system_prompt(self.confidence_score, self.company, self.ticker)
+        self._prompt_fp = self._prompt_fingerprint()
         self.system_prompt_with_history = ''
-        self.chat_history = []
-        self.summary_history = []
+        self.chat_history = deque(maxlen=_HISTORY_MAXLEN)
+        self.summary_history = deque(maxlen=_HISTORY_MAXLEN)
+        self._history_joined = ''
+        self._history_dirty = True
+        self._exact_cache = {}  # (vs_id, normalized prompt) -> (timestamp, text, annotations)
+        self._sem_cache = []  # (timestamp, vs_id, embedding, text, annotations)
+        self._summary_thread = None
 
     def create_vs(self, selected_ticker):
         """
@@ -55,27 +96,60 @@ class ClientOpenAI:
         return vector_store.id
 
     # noinspection PyTypeChecker
-    def generate(self, prompt, max_results):
+    def generate(self, prompt, max_results, cancel_event=None):
         """
         Generates documents using OpenAI API.
         The response is streamed back into streamlit
         Annotations are captured by event 'response.output_text.annotation.added' and handled separately in _process_annotations
         Each call dynamically rebuilds the system prompt with the summarized chat history.
+        An optional threading.Event lets the caller interrupt retry backoff waits.
         """
 
-        # Start with base chat history
-        self.system_prompt_with_history = self.base_system_prompt
-
-        # Add chat history if exists
-        if self.chat_history:
-            self.system_prompt_with_history += "\n\n## Conversation History Summary:\n"
-            self.system_prompt_with_history += "\n".join(f"- {summary}" for summary in self.chat_history)
+        # Wait briefly for a pending background summary so history is current.
+        # A straggler that outlives the timeout is kept around so the next
+        # call re-joins it instead of letting it mutate history unobserved.
+        if self._summary_thread is not None:
+            self._summary_thread.join(timeout=2)
+            if not self._summary_thread.is_alive():
+                self._summary_thread = None
+
+        # Rejoin the summarized history only when it changed since the last
+        # call. The flag is cleared before reading and the deque snapshotted,
+        # so an append landing mid-rebuild re-dirties it for the next turn
+        # rather than being silently dropped
+        if self._history_dirty:
+            self._history_dirty = False
+            history = tuple(self.chat_history)
+            if history:
+                self._history_joined = "\n\n## Conversation History Summary:\n"
+                self._history_joined += "\n".join(f"- {summary}" for summary in history)
+            else:
+                self._history_joined = ''
+
+        # Keep the base prompt as a stable prefix so provider-side prompt caching can hit
+        self.system_prompt_with_history = self.base_system_prompt + self._history_joined
+
+        # Serve repeated (or near-duplicate) questions from the session cache
+        cache_key = (self.vs_id, self._prompt_fp, prompt.strip().lower())
+        cached, prompt_vector = self._check_response_cache(cache_key, prompt)
+        if cached is not None:
+            cached_text, cached_annotations = cached
+            self.annotations = cached_annotations
+            # Replay in chunks to preserve the streaming UX
+            for start in range(0, len(cached_text), _CACHE_CHUNK_SIZE):
+                yield cached_text[start:start + _CACHE_CHUNK_SIZE]
+            return
 
         max_retries = 3
         base_delay = 1.0
 
         for attempt in range(max_retries):
             try:
+                # Per-attempt accumulators: a stream that dies mid-response and
+                # is retried must not leak its partial chunks into the cache
+                response_parts = []
+                completed = False
+
                 response = self.client.responses.create(
                     model=self.model,
                     input=prompt,
@@ -106,9 +180,7 @@ class ClientOpenAI:
                                 # Clean the chunk of text from any formatting
                                 text_chunk = self._clean_response(event.delta)
 
-                                # Delay between chunks
-                                time.sleep(0.04)
-
+                                response_parts.append(text_chunk)
                                 yield text_chunk
 
                         case 'response.output_text.annotation.added':
@@ -130,10 +202,16 @@ class ClientOpenAI:
                             return
 
                         case 'response.completed':
-                            pass
+                            completed = True
 
                 # Handle annotations
                 self.annotations = self._process_annotations(annotations)
+
+                # Cache the full response for repeated questions, but only when
+                # the stream finished cleanly - incomplete answers must not
+                # replay for the cache TTL as if they were complete
+                if completed:
+                    self._store_response_cache(cache_key, prompt_vector, ''.join(response_parts), self.annotations)
                 return # Success
 
             except NotFoundError as e:
@@ -150,7 +228,9 @@ class ClientOpenAI:
                 if attempt < max_retries - 1:
                     delay = base_delay * (2 ** attempt)
                     print(f"Server error. Retrying in {delay} seconds... (attempt {attempt + 1}/{max_retries})")
-                    time.sleep(delay)
+                    if self._wait_backoff(delay, cancel_event):
+                        yield "Response was cancelled"
+                        return
                     continue
                 else:
                     error_msg = "Server error. Please try again later."
@@ -161,7 +241,9 @@ class ClientOpenAI:
                 if attempt < max_retries - 1:
                     delay = base_delay * (2 ** attempt)
                     print(f"Connection error. Retrying in {delay} seconds... (attempt {attempt + 1}/{max_retries})")
-                    time.sleep(delay)
+                    if self._wait_backoff(delay, cancel_event):
+                        yield "Response was cancelled"
+                        return
                     continue
                 else:
                     error_msg = "Connection failed. Please check your internet connection."
@@ -183,13 +265,113 @@ class ClientOpenAI:
                 yield error_msg
                 return
 
+    @staticmethod
+    def _wait_backoff(delay, cancel_event):
+        """
+        Wait out a retry backoff delay.
+
+        Waits on the caller's cancel event when one is provided, so the UI can
+        abort instead of being stuck behind an uninterruptible sleep.
+
+        Args:
+            delay (float): Seconds to wait before the next retry
+            cancel_event (threading.Event or None): Optional cancellation signal
+
+        Returns:
+            bool: True if the caller cancelled during the wait
+        """
+        if cancel_event is not None:
+            return cancel_event.wait(delay)
+        time.sleep(delay)
+        return False
+
+    def _embed_prompt(self, prompt):
+        """
+        Embed a prompt for semantic cache comparison.
+
+        Delegates to the memoized module-level _embed so repeated identical
+        prompts never re-hit the embedding endpoint. Returns None if the
+        embedding call fails (the cache then falls back to exact matches only).
+
+        Args:
+            prompt (str): User prompt text
+
+        Returns:
+            tuple or None: Normalized embedding vector
+        """
+        try:
+            return _embed(self.client, prompt)
+        except Exception as e:
+            print("Error embedding prompt for cache:", e)
+            return None
+
+    def _check_response_cache(self, cache_key, prompt):
+        """
+        Look up a cached response for this prompt.
+
+        Checks the exact cache first, then compares the prompt embedding against
+        cached entries for the same vector store and system prompt (so answers
+        never leak across tickers or persona changes). Expired entries are
+        ignored.
+
+        Args:
+            cache_key (tuple): (vs_id, prompt fingerprint, normalized prompt) key
+            prompt (str): Original user prompt
+
+        Returns:
+            tuple: ((text, annotations) or None, embedding or None)
+        """
+        now = time.time()
+
+        cached = self._exact_cache.get(cache_key)
+        if cached:
+            timestamp, text, annotations = cached
+            if now - timestamp < _CACHE_TTL:
+                return (text, annotations), None
+            del self._exact_cache[cache_key]
+
+        prompt_vector = self._embed_prompt(prompt)
+        if prompt_vector is None:
+            return None, None
+
+        context = (self.vs_id, self._prompt_fp)
+        for timestamp, entry_context, vector, text, annotations in self._sem_cache:
+            if entry_context != context or now - timestamp >= _CACHE_TTL:
+                continue
+            similarity = sum(a * b for a, b in zip(prompt_vector, vector))
+            if similarity > _CACHE_SIM_THRESHOLD:
+                return (text, annotations), prompt_vector
+
+        return None, prompt_vector
+
+    def _store_response_cache(self, cache_key, prompt_vector, text, annotations):
+        """
+        Store a completed response in both cache tiers.
+
+        Args:
+            cache_key (tuple): (vs_id, prompt fingerprint, normalized prompt) key
+            prompt_vector (list or None): Normalized prompt embedding
+            text (str): Full cleaned response text
+            annotations (str): Processed annotations content
+        """
+        if not text:
+            return
+
+        now = time.time()
+        self._exact_cache[cache_key] = (now, text, annotations)
+
+        if prompt_vector is not None:
+            # Drop expired entries while we are here
+            self._sem_cache = [entry for entry in self._sem_cache if now - entry[0] < _CACHE_TTL]
+            self._sem_cache.append((now, (self.vs_id, self._prompt_fp), prompt_vector, text, annotations))
+
     def _process_annotations(self, annotations):
         """
         Process annotations provided by OpenAI API, splits either into File Citations or URLs
         """
         file_citations = []
         url_citations = []
-        reference_content = ""
+        reference_parts = []
 
         if annotations:
             for ann in annotations:
@@ -207,44 +389,37 @@ class ClientOpenAI:
 
         # Process file citations
         if file_citations:
-            unique_file_citations = {}
+            # Single pass: parse each filename once, skip duplicates by file id
+            seen_file_ids = set()
+            file_urls = []
             for ann in file_citations:
                 # Handle both dictionary and object formats
                 filename = ann.get('filename') if isinstance(ann, dict) else ann.filename
-                if filename not in unique_file_citations:
-                    unique_file_citations[filename] = ann
-
-            # Form file URLs
-            file_urls = []
-            for ann in unique_file_citations.values():
-                filename = ann.get('filename') if isinstance(ann, dict) else ann.filename
-                try:
-                    file_id_extracted = filename.split('_', 2)[2].rsplit('.', 1)[0]
-                    url = f"https://cdn-api.markitdigital.com/apiman-gateway/ASX/asx-research/1.0/file/{file_id_extracted}"
-                    file_urls.append(url)
-                except IndexError:
+                parts = filename.split('_', 2)
+                if len(parts) < 3:
+                    continue
+                file_id_extracted = parts[2].rsplit('.', 1)[0]
+                if file_id_extracted in seen_file_ids:
                     continue
+                seen_file_ids.add(file_id_extracted)
+                file_urls.append(f"https://cdn-api.markitdigital.com/apiman-gateway/ASX/asx-research/1.0/file/{file_id_extracted}")
 
             if file_urls:
-                reference_content = "🔗 Referenced Files:\n"
-                for url in file_urls:
-                    reference_content += f"- [File Link]({url})\n"
+                reference_parts.append("🔗 Referenced Files:\n")
+                reference_parts.extend(f"- [File Link]({url})\n" for url in file_urls)
 
         # Process web citations
         if url_citations:
-            web_reference_content = "🌐 Web Sources:\n"
+            if reference_parts:
+                reference_parts.append("\n")
+            reference_parts.append("🌐 Web Sources:\n")
             for ann in url_citations:
                 # Handle both dictionary and object formats
                 title = ann.get('title', 'Web Source') if isinstance(ann, dict) else getattr(ann, 'title', 'Web Source')
                 url = ann.get('url') if isinstance(ann, dict) else ann.url
-                web_reference_content += f"- [{title}]({url})\n"
-
-            if file_citations:
-                reference_content += "\n" + web_reference_content
-            else:
-                reference_content = web_reference_content
+                reference_parts.append(f"- [{title}]({url})\n")
 
-        return reference_content
+        return ''.join(reference_parts)
 
     def search(self, prompt, max_results):
         """
@@ -267,8 +442,8 @@ class ClientOpenAI:
         )
         for result in search_results.data:
             content = result.content[0].text
-            content = re.sub(r'^#{1,6}\s+', '', content, flags=re.MULTILINE)
-            content = re.sub(r'\*\*(.*?)\*\*', r'\1', content)
+            content = _HEADER_RE.sub('', content)
+            content = _BOLD_RE.sub(r'\1', content)
             result.content[0].text = content
 
         return search_results
@@ -279,14 +454,20 @@ class ClientOpenAI:
         
         Uses GPT-4o-mini to summarize the user question and assistant response,
         then maintains a rolling history of the last 5 conversation summaries.
-        
+        Trivial exchanges are summarized locally without an API call.
+
         Args:
             user_question (str): The user's input message
             assistant_response (str): The assistant's complete response
-            
+
         Returns:
             None: Updates self.chat_history and self.summary_history in place
         """
+        # Tiny exchanges aren't worth an LLM round-trip
+        if len(user_question) + len(assistant_response) < _TRIVIAL_EXCHANGE_CHARS:
+            summary = f"User asked: {user_question[:120]}. Assistant responded briefly."
+            self._append_summary(summary)
+            return
         sys_instruction = """
         You will receive user's question and assitant's response. 
         Your task is to create a precise but short summary of the conversation.
@@ -310,30 +491,62 @@ class ClientOpenAI:
                 max_output_tokens=200,
             ).output_text
 
-            self.chat_history.append(summary)
-            self.summary_history.append(summary)
-
-            # Keep only last 5
-            if len(self.chat_history) > 5:
-                self.chat_history = self.chat_history[-5:]
-
-            if len(self.summary_history) > 5:
-                self.summary_history = self.summary_history[-5:]
+            self._append_summary(summary)
 
         except Exception as e:
             print("Error in summarize_history:", e)
             return None
 
+    def summarize_history_async(self, user_question, assistant_response):
+        """
+        Run summarize_history on a daemon thread.
+
+        The summary is only needed for the next turn, so this keeps the LLM
+        summarization call off the critical path of the current response.
+        generate() joins the thread (with a short timeout) before assembling
+        the history.
+
+        Args:
+            user_question (str): The user's input message
+            assistant_response (str): The assistant's complete response
+        """
+        self._summary_thread = threading.Thread(
+            target=self.summarize_history,
+            args=(user_question, assistant_response),
+            daemon=True
+        )
+        self._summary_thread.start()
+
+    def _append_summary(self, summary):
+        """Append a summary to both histories; the deques evict beyond the window."""
+        self.chat_history.append(summary)
+        self.summary_history.append(summary)
+        self._history_dirty = True
+
+    def _prompt_fingerprint(self):
+        """Short digest of the base system prompt, used to scope the response cache"""
+        return hashlib.blake2b(self.base_system_prompt.encode(), digest_size=4).hexdigest()
+
     def update_company_info(self, company, ticker):
-        """Update company info and rebuild base system prompt"""
+        """Update company info and rebuild base system prompt.
+
+        The ticker is normalized and validated once here, so nothing on the
+        per-request path has to re-check it.
+        """
+        ticker = ticker.strip().upper()
+        if not _TICKER_RE.match(ticker):
+            print(f"Unexpected ticker format: {ticker!r}")
+
         self.company = company
         self.ticker = ticker
         self.base_system_prompt = build_system_prompt(self.confidence_score, self.company, self.ticker)
+        self._prompt_fp = self._prompt_fingerprint()
 
     def clear_chat_history(self):
         """Clear chat history when switching companies/contexts"""
-        self.chat_history = []
-        self.summary_history = []
+        self.chat_history.clear()
+        self.summary_history.clear()
+        self._history_dirty = True
 
     def _clean_response(self, text):
         """
@@ -348,8 +561,14 @@ class ClientOpenAI:
         Returns:
             str: Cleaned text safe for Streamlit display
         """
-        text = re.sub(r'\*\*(.*?)\*\*', r'`\1`', text)
+        # Most streamed deltas are a few plain characters - skip both passes
+        if '*' not in text and '$' not in text:
+            return text
+
+        if '**' in text:
+            text = _BOLD_RE.sub(r'`\1`', text)
 
         # Escape all dollar signs
-        text = text.replace('$', '\\$')
+        if '$' in text:
+            text = text.translate(_DOLLAR_ESCAPE)
         return text
@@ -1,13 +1,58 @@
-from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import atexit
 import duckdb
 import boto3
 import json
+import botocore.config
 import botocore.exceptions
 import csv
 import os
 from datetime import datetime
 
+# Announcement-type tags with the regexes that define them. The regex work is
+# paid once at Parquet conversion; queries then filter on list membership.
+_TYPE_TAG_PATTERNS = {
+    'cashflow': 'Cash',
+    'mining': 'dfs|pfs|scoping|study|feasibility|jorc|resource',
+    'placement': 'Placement|Renounceable|Security Purchase|Trading Halt',
+    'shares': 'Placement|Appendix 2A|Appendix 3B|Renounceable|Security Purchase|Appendix 3G|Trading Halt',
+    'presentation': 'presentation'
+}
+
+# SQL expression computing the category_tags column from announcementTypes
+_CATEGORY_TAGS_EXPR = "list_filter([" + ", ".join(
+    f"CASE WHEN regexp_matches(\"announcementTypes\", '{pattern}', 'i') THEN '{tag}' END"
+    for tag, pattern in _TYPE_TAG_PATTERNS.items()
+) + "], x -> x IS NOT NULL) AS category_tags"
+
+# Compact JSON for Lambda payloads - no whitespace to serialize or transfer
+_JSON_SEPARATORS = (',', ':')
+_S3_BUCKET = 'asx-storage'
+
+# Buffered conversation rows are flushed to disk once this many accumulate
+_CONV_FLUSH_ROWS = 16
+_CONV_CSV_PATH = 'data/conversations.csv'
+_CONV_WRITE_BUFFER = 1 << 20  # let the kernel coalesce appended rows
+
+# Column order for data/conversations.csv, shared by header and rows
+_CONVERSATION_FIELDS = [
+    'session_id', 'user_id', 'user_email', 'vector_store_id',
+    'num_of_docs', 's3_keys', 'ticker', 'announcement_types',
+    'price_sensitive', 'date_from', 'date_to', 'date_range',
+    'message_text', 'assistant_response', 'message_timestamp',
+    'chat_model', 'chat_mode', 'tokens_used'
+]
+
 class ConversationManager:
+    # Map UI announcement-type options to their ingest-time tags
+    TYPE_TAGS = {
+        'Cashflow Reports': 'cashflow',
+        'Mining studies/resources': 'mining',
+        'Placements': 'placement',
+        "Shares 3B's, 2A's": 'shares',
+        'Presentations': 'presentation'
+    }
+
     def __init__(self, aws_id, aws_key, aws_region):
         """
         Initialize ConversationManager with database and AWS connections.
@@ -18,6 +63,7 @@ class ConversationManager:
             aws_region (str): AWS region for service connections
         """
         self.conn = duckdb.connect()
+        self._register_views()
         self.aws_id = aws_id
         self.aws_key = aws_key
         self.aws_region = aws_region
@@ -26,91 +72,249 @@ class ConversationManager:
         self.date_to = None
         self.announcement_types = None
         self.price_sensitive = False
+        self._aws_session = None
+        self._lambda = None
+        self._query_cache = {}
+        self._keys_cache = {}
+        self._companies_cache = None
+        self._companies_mtime = 0
+        self._pending_rows = []
+        # Pay the directory/header checks once instead of on every flush
+        os.makedirs('data', exist_ok=True)
+        self._conv_header_written = os.path.exists(_CONV_CSV_PATH)
+        self._conv_fh = None
+        self._conv_writer = None
+        atexit.register(self._close_conversations)
+
+    def _register_views(self):
+        """
+        Convert the CSV sources to Parquet and register them as DuckDB views.
+
+        Queries previously re-parsed the CSVs and re-inferred their schema on
+        every call. The Parquet copies are rebuilt only when the CSV is newer,
+        so filter queries get columnar reads with predicate pushdown.
+        Announcements are additionally materialized as an in-memory table
+        ordered by (Ticker, date), so DuckDB's min/max zonemaps skip row
+        groups outside the queried ticker and date range. Falls back to a
+        view over the CSV if the conversion fails.
+        """
+        self.conn.execute("PRAGMA enable_object_cache")
+
+        for name in ('companies', 'announcements'):
+            self._refresh_source(name)
+
+    def _refresh_source(self, name):
+        """
+        Rebuild one source's Parquet copy (if stale) and (re)register it.
+
+        Cheap when the Parquet is current - just an mtime check - so callers
+        that notice the CSV changed mid-process can rerun it before querying.
+        """
+        csv_path = f'data/{name}.csv'
+        parquet_path = f'data/{name}.parquet'
+
+        # Announcements get the precomputed category_tags column at ingest
+        select_sql = f"SELECT * FROM read_csv('{csv_path}', header=True)"
+        if name == 'announcements':
+            select_sql = f"SELECT *, {_CATEGORY_TAGS_EXPR} FROM read_csv('{csv_path}', header=True)"
+
+        try:
+            if self._parquet_stale(parquet_path, csv_path, name):
+                self.conn.execute(
+                    f"COPY ({select_sql}) TO '{parquet_path}' (FORMAT PARQUET, COMPRESSION ZSTD)"
+                )
+            if name == 'announcements':
+                self.conn.execute(
+                    f"CREATE OR REPLACE TABLE {name} AS "
+                    f"SELECT * FROM read_parquet('{parquet_path}') ORDER BY Ticker, date"
+                )
+            else:
+                self.conn.execute(f"CREATE OR REPLACE VIEW {name} AS SELECT * FROM read_parquet('{parquet_path}')")
+        except Exception as e:
+            print(f'Failed to prepare parquet for {name}, using CSV. {e}')
+            self.conn.execute(f"CREATE OR REPLACE VIEW {name} AS {select_sql}")
+
+    def _parquet_stale(self, parquet_path, csv_path, name):
+        """
+        Check whether the Parquet copy needs rebuilding.
+
+        Stale when missing, older than the CSV, or (for announcements) written
+        before the category_tags column was added.
+        """
+        if not os.path.exists(parquet_path):
+            return True
+        if os.path.getmtime(parquet_path) < os.path.getmtime(csv_path):
+            return True
+        if name == 'announcements':
+            columns = [row[0] for row in self.conn.execute(
+                f"DESCRIBE SELECT * FROM read_parquet('{parquet_path}')"
+            ).fetchall()]
+            return 'category_tags' not in columns
+        return False
+
+    @property
+    def aws_session(self):
+        """
+        Lazily create and reuse a single boto3 Session.
+
+        The session resolves credentials and endpoints once; every AWS client
+        this manager needs should be built from it.
+        """
+        if self._aws_session is None:
+            self._aws_session = boto3.Session(
+                aws_access_key_id=self.aws_id,
+                aws_secret_access_key=self.aws_key,
+                region_name=self.aws_region
+            )
+        return self._aws_session
+
+    @property
+    def lambda_client(self):
+        """
+        Lazily create and reuse a single boto3 Lambda client.
+
+        Client construction loads service models and opens a connection pool,
+        so building one per invoke added avoidable latency. Reusing the client
+        also keeps warm HTTP connections across calls - which matters most
+        when the batched uploads fire several invokes in a row. The long read
+        timeout covers synchronous pdf_upload_vs runs.
+        """
+        if self._lambda is None:
+            self._lambda = self.aws_session.client(
+                'lambda',
+                config=botocore.config.Config(
+                    max_pool_connections=20,
+                    retries={'mode': 'adaptive', 'max_attempts': 2},
+                    read_timeout=900
+                )
+            )
+        return self._lambda
 
     def get_companies_data(self):
         """
         Fetch all unique companies and their ticker symbols from the database.
 
+        Cached in-process keyed by the source file's mtime, so Streamlit
+        reruns don't re-query DuckDB until companies.csv actually changes.
+
         Returns:
             dict: Dictionary mapping company names to ticker symbols
                   Format: {'Company Name': 'TICKER', ...}
         """
+        try:
+            mtime = os.stat('data/companies.csv').st_mtime_ns
+        except OSError:
+            mtime = 0
+        if self._companies_cache is not None and mtime == self._companies_mtime:
+            return self._companies_cache
+
+        # The CSV changed since registration (or this is the first query):
+        # rebuild the Parquet copy first, or the view would serve stale rows
+        self._refresh_source('companies')
+
+        query = """SELECT DISTINCT "Company Name", "Ticker" FROM companies"""
+        result = self.conn.execute(query).fetchnumpy()
 
-        query = """SELECT DISTINCT "Company Name", "Ticker" FROM read_csv('data/companies.csv', header=True)"""
-        result = self.conn.execute(query).fetchall()
+        companies_dict = dict(zip(result['Company Name'].tolist(), result['Ticker'].tolist()))
 
-        companies_dict = {row[0]: row[1] for row in result}
+        self._companies_cache = companies_dict
+        self._companies_mtime = mtime
 
         return companies_dict
 
     def _build_query(self):
         """
         Build dynamic SQL query for fetching ASX announcements based on instance filters.
-        
-        Constructs a query that filters by ticker, date range, price sensitivity,
-        and announcement types using regex patterns. Prioritizes markdown files.
-        
+
+        Constructs a parameterized query that filters by ticker, date range,
+        price sensitivity, and announcement types via the precomputed
+        category_tags column. The filter values (including the tag list) are
+        all bound parameters, so only four SQL texts exist; they are memoized
+        per instance and the statement text stays byte-identical across calls,
+        letting DuckDB reuse the prepared plan.
+
         Returns:
-            str: Complete SQL query string with all applied filters
+            tuple: (query, params) where query uses ? placeholders and params
+                   holds the filter values in order
         """
-        query = f"""
-            SELECT 
-                Ticker, 
-                url, 
+        selected = []
+        if self.announcement_types:
+            # Tags were computed by regex once at Parquet conversion, so the
+            # per-query filter is a single list-membership probe per row
+            selected = [self.TYPE_TAGS[t] for t in self.announcement_types if t in self.TYPE_TAGS]
+
+        cache_key = (self.price_sensitive, bool(selected))
+        query = self._query_cache.get(cache_key)
+
+        if query is None:
+            query = """
+            SELECT
+                Ticker,
+                url,
                 Key,
                 announcementTypes
-            FROM read_csv('data/announcements.csv', header=True)
+            FROM announcements
             WHERE 1=1
-            AND Ticker = '{self.ticker}'
-            AND date >= '{self.date_from}' 
-            AND date <= '{self.date_to}'
+            AND Ticker = ?
+            AND date >= ?
+            AND date <= ?
             """
 
-        if self.price_sensitive:
-            query += f"AND isPriceSensitive = True\n"
+            if self.price_sensitive:
+                query += "AND isPriceSensitive = True\n"
 
+            if selected:
+                query += "AND list_has_any(category_tags, ?::VARCHAR[])"
 
-        if self.announcement_types:
-            # Map announcement types to their regex patterns
-            type_patterns = {
-                'Cashflow Reports': "regexp_matches(\"announcementTypes\", 'Cash', 'i')",
-                'Mining studies/resources': "regexp_matches(\"announcementTypes\", 'dfs|pfs|scoping|study|feasibility|jorc|resource', 'i')",
-                'Placements': "regexp_matches(\"announcementTypes\", 'Placement|Renounceable|Security Purchase|Trading Halt', 'i')",
-                "Shares 3B's, 2A's": "regexp_matches(\"announcementTypes\", 'Placement|Appendix 2A|Appendix 3B|Renounceable|Security Purchase|Appendix 3G|Trading Halt', 'i')",
-                'Presentations': "regexp_matches(\"announcementTypes\", 'presentation', 'i')"
-            }
-
-            # Build OR conditions for selected types
-            conditions = [type_patterns[t] for t in self.announcement_types if t in type_patterns]
+            self._query_cache[cache_key] = query
 
-            if conditions:
-                and_statement = f"AND ({' OR '.join(conditions)})"
-                query += and_statement
+        params = [self.ticker, self.date_from, self.date_to]
+        if selected:
+            params.append(selected)
 
-        return query
+        return query, params
 
     def get_s3_keys(self):
         """
         Execute the built query and extract S3 keys and announcement type statistics.
         
         Uses the query built by _build_query() to fetch document keys and count
-        announcement types for the current filter criteria.
-        
+        announcement types for the current filter criteria. Results are
+        memoized per filter combination, so Streamlit reruns that only touch
+        chat-side settings skip the DuckDB round-trip.
+
         Returns:
             tuple: (keys_list, types_counted) where keys_list contains S3 object keys
-                   and types_counted is a Counter object with announcement type frequencies
+                   and types_counted maps announcement types to their frequencies
         """
-        query = self._build_query()
-        result = self.conn.execute(query).fetchall()
+        fingerprint = (
+            self.ticker, str(self.date_from), str(self.date_to),
+            tuple(sorted(self.announcement_types or ())), self.price_sensitive
+        )
+        cached = self._keys_cache.get(fingerprint)
+        if cached is not None:
+            return cached
+
+        query, params = self._build_query()
 
-        # Get the list of urls to download
-        keys_list = [url[2] for url in result]
+        # Arrow export keeps the strings in contiguous buffers instead of
+        # materializing a Python tuple per row
+        table = self.conn.execute(query, params).fetch_arrow_table()
+        keys_list = table.column('Key').to_pylist()
 
-        # Get the list of types and count them
-        types_list = [url[3] for url in result]
-        types_counted = Counter(types_list)
+        # Let DuckDB aggregate the type histogram; Python only receives the
+        # small grouped result rather than one string object per row
+        count_query = f"SELECT announcementTypes, COUNT(*) AS n FROM ({query}) GROUP BY 1"
+        counts = self.conn.execute(count_query, params).fetch_arrow_table()
+        types_counted = dict(zip(
+            counts.column('announcementTypes').to_pylist(),
+            counts.column('n').to_pylist()
+        ))
 
-        return keys_list, types_counted
+        result = (keys_list, types_counted)
+        self._keys_cache[fingerprint] = result
+
+        return result
 
     def create_payload(self, keys, vs_id):
         """
@@ -131,7 +335,7 @@ class ConversationManager:
                 {
                     "s3": {
                         "bucket": {
-                            "name": "asx-storage"
+                            "name": _S3_BUCKET
                         },
                         "object": {
                             "keys": keys,
@@ -142,109 +346,179 @@ class ConversationManager:
             ]
         }
 
-    def lambda_s3_files_upload(self, function_name='pdf_upload_vs', payload=None):
+    def lambda_s3_files_upload(self, function_name='pdf_upload_vs', payload=None, wait=True):
         """
         Invoke AWS Lambda function to upload S3 files to OpenAI vector store.
-        
-        Creates Lambda client and invokes the specified function with the payload.
-        Handles timeout errors gracefully.
-        
+
+        Invokes the specified function with the payload on the shared client.
+        With wait=False the invoke is asynchronous (InvocationType='Event'),
+        returning as soon as Lambda has queued the request instead of blocking
+        until every PDF is uploaded. Handles timeout errors gracefully.
+
         Args:
             function_name (str, optional): Lambda function name. Defaults to 'pdf_upload_vs'
             payload (dict, optional): Lambda payload. Defaults to empty dict
-            
+            wait (bool, optional): Block for the function result. Defaults to True
+
         Returns:
-            dict or None: Lambda response data, None if timeout occurs
+            dict or int or None: Lambda response data, the enqueue status code
+                                 when wait=False, or None if timeout occurs
         """
-        lambda_client = boto3.client(
-            'lambda',
-            aws_access_key_id=self.aws_id,
-            aws_secret_access_key=self.aws_key,
-            region_name=self.aws_region
-        )
-
         try:
-            response = lambda_client.invoke(
+            if not wait:
+                response = self.lambda_client.invoke(
+                    FunctionName=function_name,
+                    InvocationType='Event',
+                    Payload=json.dumps(payload or {}, separators=_JSON_SEPARATORS)
+                )
+                return response['StatusCode']
+
+            response = self.lambda_client.invoke(
                 FunctionName=function_name,
-                Payload=json.dumps(payload or {})
+                Payload=json.dumps(payload or {}, separators=_JSON_SEPARATORS)
             )
-            result = json.loads(response['Payload'].read())
-            return result
+            resp_bytes = response['Payload'].read()
+            # The failure sentinel is tiny and fixed; skip the JSON parser for it
+            if resp_bytes == b'-1':
+                return -1
+            return json.loads(resp_bytes)
         except botocore.exceptions.ReadTimeoutError:
             return None
 
+    def upload_keys_async(self, keys, vs_id, function_name='pdf_upload_vs', batch_size=10):
+        """
+        Queue S3 keys for vector-store upload as batched async Lambda invokes.
+
+        Splits the keys into batches and fires each with wait=False, so the
+        caller returns as soon as Lambda has accepted the work instead of
+        blocking for the full ingestion. Readiness must be checked separately
+        (e.g. by listing the vector store files).
+
+        Args:
+            keys (list): S3 object keys to upload
+            vs_id (str): OpenAI vector store ID for document upload
+            function_name (str, optional): Lambda function name. Defaults to 'pdf_upload_vs'
+            batch_size (int, optional): Keys per invocation. Defaults to 10
+
+        Returns:
+            list: Enqueue status code (202) or None per batch
+        """
+        statuses = []
+        for start in range(0, len(keys), batch_size):
+            payload = self.create_payload(keys=keys[start:start + batch_size], vs_id=vs_id)
+            statuses.append(self.lambda_s3_files_upload(function_name=function_name, payload=payload, wait=False))
+        return statuses
+
+    def upload_keys_parallel(self, keys, vs_id, function_name='pdf_upload_vs', batch_size=10, max_workers=8):
+        """
+        Upload S3 keys as parallel batches of synchronous Lambda invokes.
+
+        Blocks until every batch finishes, so callers keep the documents-ready
+        guarantee on return, but total latency approximates the slowest batch
+        instead of the sum - boto3 releases the GIL during network I/O and the
+        shared client's connection pool covers the workers.
+
+        Args:
+            keys (list): S3 object keys to upload
+            vs_id (str): OpenAI vector store ID for document upload
+            function_name (str, optional): Lambda function name. Defaults to 'pdf_upload_vs'
+            batch_size (int, optional): Keys per invocation. Defaults to 10
+            max_workers (int, optional): Concurrent invokes. Defaults to 8
+
+        Returns:
+            list: Lambda response data (or None on timeout) per batch
+        """
+        batches = [keys[start:start + batch_size] for start in range(0, len(keys), batch_size)]
+        if not batches:
+            return []
+
+        def invoke_batch(batch):
+            payload = self.create_payload(keys=batch, vs_id=vs_id)
+            return self.lambda_s3_files_upload(function_name=function_name, payload=payload)
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            return list(executor.map(invoke_batch, batches))
+
     def save_user_data_to_db(self, user_data):
         """
         Save conversation session data to a local CSV file.
-        
-        Appends a complete conversation record including user info, vector store data,
-        query parameters, messages, and chat settings to data/conversations.csv.
-        
+
+        Buffers the record in memory and appends to data/conversations.csv in
+        batches, so each message doesn't pay a full open/write/close cycle.
+        Remaining rows are flushed at interpreter exit.
+
         Args:
             user_data (dict): Structured conversation data containing:
                              - session_id, user info, vector_store details
                              - query parameters, message content, chat_settings
-                             
+
         Raises:
             Exception: Prints error message if CSV write fails
         """
-        # Extract data from user_data dict
-        session_id = user_data['session_id']
-        # User
-        user_id = user_data['user']['user_id']
-        user_email = user_data['user']['user_email']
-
-        # Vector Store
-        vector_store_id = user_data['vector_store']['vs_id']
-        num_of_docs = user_data['vector_store']['num_of_docs']
-        s3_keys = user_data['vector_store']['s3_keys']
-
-        # Selections
-        ticker = user_data['query']['selected_ticker']
-        announcement_types = user_data['query']['announcement_types']
-        price_sensitive = user_data['query']['price_sensitive']
-        date_from = user_data['query']['date_from']
-        date_to = user_data['query']['date_to']
-        date_range = user_data['query']['date_range']
-
-        # Message
-        message_text = user_data['message']['message_text']
-        message_timestamp = user_data['message']['message_timestamp']
-        assistant_response = user_data['message']['assistant_response']
-
-        # Chat settings
-        chat_model = user_data['chat_settings']['chat_model']
-        chat_mode = user_data['chat_settings']['chat_mode']
-        chat_tokens = user_data['chat_settings']['tokens_used']
-
-        # Prepare CSV file path
-        csv_file_path = 'data/conversations.csv'
-        file_exists = os.path.exists(csv_file_path)
-        
-        # Ensure data directory exists
-        os.makedirs('data', exist_ok=True)
-        
+        # Flatten user_data into a row following _CONVERSATION_FIELDS order
+        user = user_data['user']
+        vector_store = user_data['vector_store']
+        query = user_data['query']
+        message = user_data['message']
+        chat_settings = user_data['chat_settings']
+
+        row = [
+            user_data['session_id'], user['user_id'], user['user_email'],
+            vector_store['vs_id'], vector_store['num_of_docs'], vector_store['s3_keys'],
+            query['selected_ticker'], query['announcement_types'], query['price_sensitive'],
+            query['date_from'], query['date_to'], query['date_range'],
+            message['message_text'], message['assistant_response'], message['message_timestamp'],
+            chat_settings['chat_model'], chat_settings['chat_mode'], chat_settings['tokens_used']
+        ]
+
+        self._pending_rows.append(row)
+
+        if len(self._pending_rows) >= _CONV_FLUSH_ROWS:
+            self.flush_conversations()
+
+    def flush_conversations(self):
+        """
+        Append the buffered conversation rows to data/conversations.csv.
+
+        Called automatically once the buffer fills and at interpreter exit;
+        safe to call any time to force a write.
+        """
+        if not self._pending_rows:
+            return
+
         try:
-            with open(csv_file_path, 'a', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                
-                # Write header if file doesn't exist
-                if not file_exists:
-                    writer.writerow([
-                        'session_id', 'user_id', 'user_email', 'vector_store_id', 
-                        'num_of_docs', 's3_keys', 'ticker', 'announcement_types', 
-                        'price_sensitive', 'date_from', 'date_to', 'date_range',
-                        'message_text', 'assistant_response', 'message_timestamp', 
-                        'chat_model', 'chat_mode', 'tokens_used'
-                    ])
-                
-                # Write data row
-                writer.writerow([
-                    session_id, user_id, user_email, vector_store_id,
-                    num_of_docs, s3_keys, ticker, announcement_types,
-                    price_sensitive, date_from, date_to, date_range,
-                    message_text, assistant_response, message_timestamp,
-                    chat_model, chat_mode, chat_tokens
-                ])
+            self._conversation_writer().writerows(self._pending_rows)
+            self._pending_rows = []
         except Exception as e:
             print(f'Failed to save to CSV file. {e}')
+
+    def _conversation_writer(self):
+        """
+        Lazily open the session-long append handle for the conversation log.
+
+        The handle stays open across flushes, so each write skips the
+        open/seek/close syscall cycle; the OS block buffer handles persistence
+        and _close_conversations closes it at interpreter exit.
+        """
+        if self._conv_writer is None:
+            self._conv_fh = open(_CONV_CSV_PATH, 'a', newline='', encoding='utf-8', buffering=_CONV_WRITE_BUFFER)
+            self._conv_writer = csv.writer(self._conv_fh)
+
+            # Write header on the first ever flush
+            if not self._conv_header_written:
+                self._conv_writer.writerow(_CONVERSATION_FIELDS)
+                self._conv_header_written = True
+
+        return self._conv_writer
+
+    def _close_conversations(self):
+        """Flush buffered rows and close the log handle at interpreter exit."""
+        self.flush_conversations()
+
+        if self._conv_fh is not None:
+            try:
+                self._conv_fh.close()
+            except Exception as e:
+                print(f'Failed to close conversations log. {e}')
+            self._conv_fh = None
+            self._conv_writer = None
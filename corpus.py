@@ -7,10 +7,19 @@ import hashlib
 from client_openai import ClientOpenAI
 from conversation_manager import ConversationManager
 
+class TickerState:
+    """Per-ticker snapshot kept across company switches within a session"""
+    __slots__ = ('vs_id', 'docs', 'query_hash')
+
+    def __init__(self):
+        self.vs_id = None
+        self.docs = []
+        self.query_hash = None
+
 def create_query_hash(ticker, date_from, date_to, announcement_types, price_sensitive):
     """Create unique hash for the query"""
-    query_string = f"{ticker}_{date_from}_{date_to}_{sorted(announcement_types or [])}_{price_sensitive}"
-    return hashlib.md5(query_string.encode()).hexdigest()[:8]
+    key = (ticker, str(date_from), str(date_to), tuple(sorted(announcement_types or ())), price_sensitive)
+    return hashlib.blake2b(repr(key).encode(), digest_size=4).hexdigest()
 
 def needs_vs_update(conversation_manager):
     """Check if we need to create new vs and upload the documents"""
@@ -46,23 +55,21 @@ def get_new_docs(conversation_manager):
 
     new_files, new_types_counted = conversation_manager.get_s3_keys()
 
-    prev_files = st.session_state.get('loaded_documents', [])
+    # Set membership keeps this O(N+M) as loaded_documents grows
+    prev_files = set(st.session_state.get('loaded_documents', []))
     increment_files = [file for file in new_files if file not in prev_files]
     return increment_files, new_types_counted, new_files
 
-def chat_placeholder_text(ticker, chat_mode):
-    text = ''
-
-    if ticker and chat_mode:
-        text = "Ask a question about ASX ticker you want to research"
-    elif ticker and not chat_mode:
-        text = 'Please select chat mode'
-    elif not ticker and chat_mode:
-        text = 'Please select the company first'
-    elif not ticker and not chat_mode:
-        text = 'Please select the company and chat mode'
+# Indexed by (ticker set) << 1 | (chat mode set)
+_PLACEHOLDERS = (
+    'Please select the company and chat mode',
+    'Please select the company first',
+    'Please select chat mode',
+    "Ask a question about ASX ticker you want to research",
+)
 
-    return text
+def chat_placeholder_text(ticker, chat_mode):
+    return _PLACEHOLDERS[(bool(ticker) << 1) | bool(chat_mode)]
 
 def generate_prompts_buttons(input_disabled):
     defined_prompts = [
@@ -82,11 +89,22 @@ def generate_prompts_buttons(input_disabled):
                 return prompt_text
     return None
 
-@st.cache_data(ttl=1200, show_spinner='Fetching data...')
+# cache_resource returns by reference (no pickle round-trip per rerun) and is
+# shared process-wide: the companies dict is identical for every user and
+# vector store creation per ticker is idempotent within the TTL
+@st.cache_resource(ttl=1200, show_spinner='Fetching data...')
 def get_company_data():
     return st.session_state.conversation_manager.get_companies_data()
 
-@st.cache_data(ttl=1200, show_spinner='Fetching data...')
+# Same TTL as get_company_data so the labels refresh together with the dict
+@st.cache_resource(ttl=1200, show_spinner='Fetching data...')
+def get_company_options():
+    companies_dict = get_company_data()
+    options = [None] + [f"{key} ({value})" for key, value in companies_dict.items()]
+    label_to_ticker = {f"{key} ({value})": value for key, value in companies_dict.items()}
+    return options, label_to_ticker
+
+@st.cache_resource(ttl=1200, show_spinner='Fetching data...')
 def get_or_create_vector_store(ticker):
     return st.session_state.openai_client.create_vs(ticker)
 
@@ -163,15 +181,9 @@ if 'loaded_documents' not in st.session_state:
 if 'current_query_hash' not in st.session_state:
     st.session_state.current_query_hash = None
 
-# Track ticker-specific vector stores
-if 'ticker_vector_stores' not in st.session_state:
-    st.session_state.ticker_vector_stores = {}
-
-if 'ticker_loaded_documents' not in st.session_state:
-    st.session_state.ticker_loaded_documents = {}
-
-if 'ticker_query_hashes' not in st.session_state:
-    st.session_state.ticker_query_hashes = {}
+# Track ticker-specific vector store, documents and query hash
+if 'ticker_states' not in st.session_state:
+    st.session_state.ticker_states = {}
 
 st.set_page_config(layout="wide")
 
@@ -183,19 +195,19 @@ col1, col2, col3 = st.columns([1,4,1])
 # Left column - Query settings
 with col1:
 
-    companies_dict = get_company_data()
+    company_options, label_to_ticker = get_company_options()
 
     selected_company = st.selectbox(
         label="Select the company",
         key="company_selectbox",
-        options=[None] + [f"{key} ({value})" for key, value in companies_dict.items()],
+        options=company_options,
         help="Select which company would you like to chat about",
         format_func=lambda x: "Select an option" if x is None else x
     )
 
     if selected_company:
         company_name = selected_company.split(" (")[0]
-        ticker = companies_dict[company_name]
+        ticker = label_to_ticker[selected_company]
 
         # Add to conversation manager
         conversation_manager.ticker = ticker
@@ -205,34 +217,30 @@ with col1:
 
         # Handle ticker changes with vector store caching
         if conversation_manager.ticker != st.session_state.ticker:
-            # Save current state before switching
+            # Save current state before switching; loaded_documents is the
+            # record's own list, so only the query hash needs writing back
             if st.session_state.ticker:
-                st.session_state.ticker_loaded_documents[
-                    st.session_state.ticker] = st.session_state.loaded_documents.copy()
-                st.session_state.ticker_query_hashes[st.session_state.ticker] = st.session_state.current_query_hash
+                st.session_state.ticker_states[
+                    st.session_state.ticker].query_hash = st.session_state.current_query_hash
 
             # Switch to new ticker
             st.session_state.ticker = conversation_manager.ticker
 
             if st.session_state.ticker:
-                # Check if we have a cached vector store for this ticker
-                if st.session_state.ticker in st.session_state.ticker_vector_stores:
-                    st.session_state.vector_store_id = st.session_state.ticker_vector_stores[st.session_state.ticker]
-                    st.session_state.kb_ready = True  # Assume ready since it's cached
+                ticker_state = st.session_state.ticker_states.setdefault(
+                    st.session_state.ticker, TickerState())
 
-                    # Restore loaded documents and query hash for this ticker
-                    st.session_state.loaded_documents = st.session_state.ticker_loaded_documents.get(
-                        st.session_state.ticker, [])
-                    st.session_state.current_query_hash = st.session_state.ticker_query_hashes.get(
-                        st.session_state.ticker, None)
+                if ticker_state.vs_id:
+                    st.session_state.kb_ready = True  # Assume ready since it's cached
                 else:
                     # Create new vector store for this ticker
-                    vector_store_id = get_or_create_vector_store(st.session_state.ticker)
-                    st.session_state.vector_store_id = vector_store_id
-                    st.session_state.ticker_vector_stores[st.session_state.ticker] = vector_store_id
+                    ticker_state.vs_id = get_or_create_vector_store(st.session_state.ticker)
                     st.session_state.kb_ready = False
-                    st.session_state.loaded_documents = []  # Reset for new ticker
-                    st.session_state.current_query_hash = None  # Reset query hash for new ticker
+
+                # Restore loaded documents and query hash for this ticker
+                st.session_state.vector_store_id = ticker_state.vs_id
+                st.session_state.loaded_documents = ticker_state.docs
+                st.session_state.current_query_hash = ticker_state.query_hash
 
             # Clear chat history when ticker changes
             st.session_state.messages = [{"role": "assistant", "avatar": AVATAR, "content": first_message}]
@@ -366,8 +374,8 @@ with col2:
             user_question = st.session_state.current_prompt
             assistant_response = full_response
 
-            # Summarize and add to history
-            client.summarize_history(user_question, assistant_response)
+            # Summarize in the background; generate() waits for it next turn
+            client.summarize_history_async(user_question, assistant_response)
 
             # Grab the full message
             st.session_state.messages[-1]["content"] = full_response
@@ -424,39 +432,33 @@ with col2:
             with st.spinner(spinner_text, show_time=True):
                 if incremental_pdfs:
                     # Add only new documents to existing vector store
-                    payload = conversation_manager.create_payload(keys=incremental_pdfs, vs_id=st.session_state.vector_store_id)
-                    upload = conversation_manager.lambda_s3_files_upload(payload=payload)
+                    uploads = conversation_manager.upload_keys_parallel(keys=incremental_pdfs, vs_id=st.session_state.vector_store_id)
 
-                    if upload == -1:
+                    if -1 in uploads:
                         st.toast(icon='⚠️', body='Error uploading new files')
                         time.sleep(2)
 
+                    # loaded_documents is the ticker record's list, so the
+                    # per-ticker cache sees this update without a copy
                     st.session_state.loaded_documents.extend(incremental_pdfs)
-                    # Also update the ticker-specific cache
-                    if st.session_state.ticker:
-                        st.session_state.ticker_loaded_documents[
-                            st.session_state.ticker] = st.session_state.loaded_documents.copy()
                 elif all_pdfs:
                     # This handles case where we have a cached vector store but need to load documents
-                    payload = conversation_manager.create_payload(keys=all_pdfs, vs_id=st.session_state.vector_store_id)
-                    upload = conversation_manager.lambda_s3_files_upload(payload=payload)
+                    uploads = conversation_manager.upload_keys_parallel(keys=all_pdfs, vs_id=st.session_state.vector_store_id)
 
-                    if upload == -1:
+                    if -1 in uploads:
                         st.toast(icon='⚠️', body='Error uploading new files')
 
-                    st.session_state.loaded_documents = all_pdfs
-                    # Also update the ticker-specific cache
-                    if st.session_state.ticker:
-                        st.session_state.ticker_loaded_documents[
-                            st.session_state.ticker] = st.session_state.loaded_documents.copy()
+                    # In-place so the ticker record keeps the same list object
+                    st.session_state.loaded_documents[:] = all_pdfs
 
                 # Update session state
                 st.session_state.types_counted = new_types_counted
                 st.session_state.kb_ready = True
 
-                # Save the current query hash to ticker cache
+                # Save the current query hash to the ticker record
                 if st.session_state.ticker:
-                    st.session_state.ticker_query_hashes[st.session_state.ticker] = st.session_state.current_query_hash
+                    st.session_state.ticker_states[
+                        st.session_state.ticker].query_hash = st.session_state.current_query_hash
 
         # Generate/Search
         if st.session_state.search_generate == 'Generate':